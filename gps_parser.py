@@ -1,136 +1,578 @@
 import sys
+import os
+import glob
 import xml.etree.ElementTree as ET
 import json
 import math # Needed for NaN if we choose to use it, though None->null is fine.
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 
-def parse_gpx(gpx_path):
+import numpy as np
+
+try:
+    # Optional: lxml's C parser with a target handler avoids building
+    # Python Element objects entirely. Falls back to ElementTree streaming.
+    from lxml import etree as LET
+    PARSE_ERRORS = (ET.ParseError, LET.ParseError)
+except ImportError:
+    LET = None
+    PARSE_ERRORS = (ET.ParseError,)
+
+try:
+    # Optional: compiles the sequential thinning kernel to machine code.
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        # No-op stand-in so the kernel runs as plain Python
+        return lambda func: func
+
+@dataclass
+class Track:
     """
-    Parses a GPX file and returns a list of (latitude, longitude, altitude).
-    Handles potential parsing errors.
+    Parsed trackpoints stored column-wise (structure of arrays): one
+    contiguous float64 array each for latitude, longitude and altitude.
+    Also carries the lat/lon extent of the points so bounding-box queries
+    that cover the whole track can skip the per-point filter, and the
+    number of valid trackpoints the parser read before any bbox filtering
+    it applied ('parsed', carried over by take()).
+
+    'index' holds each point's position in the parsed sequence once points
+    have been dropped (None while the points are still contiguous), so
+    filters can tell where the original track had a gap.
     """
+    lats: np.ndarray
+    lons: np.ndarray
+    alts: np.ndarray
+    min_lat: float
+    max_lat: float
+    min_lon: float
+    max_lon: float
+    parsed: int = 0
+    index: np.ndarray = None
+
+    @classmethod
+    def from_arrays(cls, lats, lons, alts, parsed=None, index=None):
+        # array('d') exposes its buffer, so this wraps it without copying
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        alts = np.asarray(alts, dtype=np.float64)
+        if index is not None:
+            index = np.asarray(index, dtype=np.int64)
+        if parsed is None:
+            parsed = len(lats)
+        if len(lats) == 0:
+            # Empty extent: contained in every bounding box
+            return cls(lats, lons, alts, math.inf, -math.inf, math.inf, -math.inf, parsed, index)
+        return cls(lats, lons, alts,
+                   float(lats.min()), float(lats.max()),
+                   float(lons.min()), float(lons.max()), parsed, index)
+
+    def __len__(self):
+        return len(self.lats)
+
+    def positions(self):
+        """Position of each point in the parsed sequence."""
+        return self.index if self.index is not None else np.arange(len(self))
+
+    def take(self, keep):
+        """Returns a Track of the points selected by index array/mask/slice 'keep'."""
+        return Track.from_arrays(self.lats[keep], self.lons[keep], self.alts[keep],
+                                 self.parsed, self.positions()[keep])
+
+    def run_starts(self):
+        """Boolean mask of points that do not directly follow the previous one."""
+        starts = np.ones(len(self), dtype=np.bool_)
+        starts[1:] = np.diff(self.positions()) != 1
+        return starts
+
+def gpx_tags(root_tag):
+    """
+    Returns the (trkpt, ele) tag names to match, namespaced if the GPX root
+    element is. Called once per document, so the per-point loops compare
+    against precomputed strings.
+    """
+    # Determine if there's a namespace from the root element
+    if root_tag.startswith("{") and "}gpx" in root_tag:
+        ns = root_tag.split("}")[0].strip("{")
+        return f"{{{ns}}}trkpt", f"{{{ns}}}ele"
+    return "trkpt", "ele"
+
+def append_points(lats, lons, alts, lat_texts, lon_texts, ele_texts, bbox=None,
+                  index=None, start=0):
+    """
+    Converts a batch of trackpoint attribute/element strings to floats and
+    appends them to the lats/lons/alts array('d') columns. If 'bbox' is
+    given as corners (lat1, lon1, lat2, lon2), only points inside it are
+    appended, so out-of-box points never reach the full-size columns, and
+    if 'index' (an array('q')) is given each appended point's position in
+    the parsed sequence is recorded in it, counting from 'start'.
+
+    Well-formed GPX is the common case, so the whole batch is first
+    converted with one vectorized NumPy call per column. Only if that
+    raises, or yields a non-finite value (nan/inf), does it fall back to
+    per-point conversion, which skips points with bad coordinates and uses
+    0.0 for bad altitudes, with warnings.
+
+    Returns the number of valid points in the batch, before bbox filtering.
+    """
+    if bbox is None:
+        min_lat = min_lon = -math.inf
+        max_lat = max_lon = math.inf
+    else:
+        lat1, lon1, lat2, lon2 = bbox
+        min_lat, max_lat = min(lat1, lat2), max(lat1, lat2)
+        min_lon, max_lon = min(lon1, lon2), max(lon1, lon2)
+
     try:
-        tree = ET.parse(gpx_path)
-        root = tree.getroot()
-    except ET.ParseError as e:
-        print(f"Error parsing GPX file {gpx_path}: {e}", file=sys.stderr)
-        return None # Indicate failure
-    except FileNotFoundError:
-        print(f"Error: GPX file not found at {gpx_path}", file=sys.stderr)
-        return None # Indicate failure
+        lat_arr = np.array(lat_texts, dtype=np.float64)
+        lon_arr = np.array(lon_texts, dtype=np.float64)
+        alt_arr = np.array(ele_texts, dtype=np.float64)
+        finite = (np.isfinite(lat_arr).all() and np.isfinite(lon_arr).all() and
+                  np.isfinite(alt_arr).all())
+    except ValueError:
+        finite = False
+    if finite:
+        if bbox is not None:
+            mask = ((lat_arr >= min_lat) & (lat_arr <= max_lat) &
+                    (lon_arr >= min_lon) & (lon_arr <= max_lon))
+            lat_arr, lon_arr, alt_arr = lat_arr[mask], lon_arr[mask], alt_arr[mask]
+            if index is not None:
+                index.frombytes((start + np.flatnonzero(mask)).astype(np.int64).view(np.uint8))
+        # frombytes reads a zero-copy uint8 view of each contiguous ndarray,
+        # so each column grows once per batch with no intermediate bytes copy
+        lats.frombytes(lat_arr.view(np.uint8))
+        lons.frombytes(lon_arr.view(np.uint8))
+        alts.frombytes(alt_arr.view(np.uint8))
+        return len(lat_texts)
+
+    valid = 0
 
-    # Determine if there's a namespace
-    ns = None
-    if root.tag.startswith("{") and "}gpx" in root.tag:
-        ns = root.tag.split("}")[0].strip("{")
-
-    # Helper function to handle namespaced tags
-    def nstag(tag):
-        if ns:
-            return f"{{{ns}}}{tag}"
-        return tag
-
-    coords = []
-    # Look for <trkpt lat="..." lon="..."> elements
-    # Using root.findall('.//' + nstag('trkpt')) is slightly more explicit
-    # for finding descendants than root.iter, but iter works fine too.
-    for trkpt in root.iter(nstag("trkpt")):
+    for lat_text, lon_text, ele_text in zip(lat_texts, lon_texts, ele_texts):
         try:
-            lat = float(trkpt.attrib["lat"])
-            lon = float(trkpt.attrib["lon"])
-            ele_elem = trkpt.find(nstag("ele"))
-            alt = 0.0 # Default altitude
-            if ele_elem is not None and ele_elem.text is not None:
-                 try:
-                     alt = float(ele_elem.text)
-                 except ValueError:
-                     # Ignore invalid altitude text, keep default 0.0
-                     print(f"Warning: Invalid altitude '{ele_elem.text}' found, using 0.0.", file=sys.stderr)
-                     pass # Keep alt = 0.0
-            coords.append((lat, lon, alt))
-        except KeyError as e:
-            print(f"Warning: Skipping trackpoint missing required attribute: {e}", file=sys.stderr)
-            continue # Skip this point
+            lat = float(lat_text)
+            lon = float(lon_text)
+            if not (math.isfinite(lat) and math.isfinite(lon)):
+                raise ValueError(f"non-finite coordinate: {lat_text!r}, {lon_text!r}")
         except ValueError as e:
             print(f"Warning: Skipping trackpoint with invalid coordinate value: {e}", file=sys.stderr)
-            continue # Skip this point
+            continue
+        try:
+            alt = float(ele_text)
+            if not math.isfinite(alt):
+                raise ValueError(ele_text)
+        except ValueError:
+            # Ignore invalid altitude text, keep default 0.0
+            print(f"Warning: Invalid altitude '{ele_text}' found, using 0.0.", file=sys.stderr)
+            alt = 0.0
+        if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+            lats.append(lat)
+            lons.append(lon)
+            alts.append(alt)
+            if index is not None:
+                index.append(start + valid)
+        valid += 1
+    return valid
 
-    return coords
+def parse_gpx_stream(fileobj, chunk=1 << 20, bbox=None):
+    """
+    Parses GPX data from a binary file-like object (file, socket, gzip stream)
+    and returns a Track of (latitude, longitude, altitude) points, keeping
+    only those inside 'bbox' (lat1, lon1, lat2, lon2) if it is given.
 
-def filter_coords_by_bbox(coords, lat1, lon1, lat2, lon2):
+    Data is read in 'chunk'-byte blocks and fed to an XMLPullParser, so peak
+    memory is one buffer plus one <trkpt> subtree. Each finished trackpoint
+    is cleared and detached from its parent.
+    Raises ET.ParseError if the data is not well-formed XML.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    trkpt_tag = "trkpt"
+    ele_tag = "ele"
+    lats, lons, alts = array('d'), array('d'), array('d')
+    # Stack of currently open elements, so a finished trkpt can be removed
+    # from its parent (usually <trkseg>, not the root).
+    stack = []
+    parsed = 0
+    # Parse positions of kept points, only needed once the bbox drops some
+    index = array('q') if bbox is not None else None
+
+    def drain():
+        nonlocal trkpt_tag, ele_tag, parsed
+        # Raw strings for this chunk, converted in one batch at the end
+        lat_texts, lon_texts, ele_texts = [], [], []
+        # Local aliases for the per-element loop (LOAD_FAST instead of
+        # global and attribute lookups on every trackpoint)
+        _find = ET.Element.find
+        push, pop = stack.append, stack.pop
+        append_lat, append_lon, append_ele = lat_texts.append, lon_texts.append, ele_texts.append
+
+        for event, elem in parser.read_events():
+            if event == "start":
+                if not stack:
+                    trkpt_tag, ele_tag = gpx_tags(elem.tag)
+                push(elem)
+                continue
+
+            pop()
+            if elem.tag != trkpt_tag:
+                continue
+
+            # Look for <trkpt lat="..." lon="..."> elements
+            lat_text = elem.get("lat")
+            lon_text = elem.get("lon")
+            if lat_text is None or lon_text is None:
+                missing = "lat" if lat_text is None else "lon"
+                print(f"Warning: Skipping trackpoint missing required attribute: '{missing}'", file=sys.stderr)
+            else:
+                ele_elem = _find(elem, ele_tag)
+                ele_text = ele_elem.text if ele_elem is not None else None
+                append_lat(lat_text)
+                append_lon(lon_text)
+                append_ele(ele_text if ele_text is not None else "0.0") # Default altitude
+
+            # Release the finished subtree
+            elem.clear()
+            if stack:
+                stack[-1].remove(elem)
+
+        parsed += append_points(lats, lons, alts, lat_texts, lon_texts, ele_texts,
+                                bbox, index, parsed)
+
+    while True:
+        buf = fileobj.read(chunk)
+        if not buf:
+            break
+        parser.feed(buf)
+        drain()
+    parser.close() # Raises ParseError on truncated documents
+    drain()
+
+    return Track.from_arrays(lats, lons, alts, parsed, index)
+
+class TrkptTarget:
+    """
+    lxml parser target that collects (latitude, longitude, altitude) points
+    straight from SAX-style callbacks, without creating any Elements.
+    Raw strings are buffered and converted every 'batch' points by
+    append_points, which also applies the optional 'bbox'.
+    close() returns the points as a Track.
+    """
+
+    def __init__(self, batch=1 << 16, bbox=None):
+        self.batch = batch
+        self.bbox = bbox
+        self.parsed = 0
+        self.index = array('q') if bbox is not None else None
+        self.lats = array('d')
+        self.lons = array('d')
+        self.alts = array('d')
+        self.lat_texts = []
+        self.lon_texts = []
+        self.ele_texts = []
+        self.trkpt_tag = "trkpt"
+        self.ele_tag = "ele"
+        self.depth = 0
+        self.in_trkpt = False
+        self.in_ele = False
+        self.lat = None
+        self.lon = None
+        self.ele_text = None
+
+    def start(self, tag, attrib):
+        if self.depth == 0:
+            self.trkpt_tag, self.ele_tag = gpx_tags(tag)
+        self.depth += 1
+
+        if tag == self.trkpt_tag:
+            self.in_trkpt = True
+            self.ele_text = None
+            self.lat = attrib.get("lat")
+            self.lon = attrib.get("lon")
+        elif self.in_trkpt and tag == self.ele_tag:
+            self.in_ele = True
+            self.ele_text = []
+
+    def data(self, text):
+        if self.in_ele:
+            self.ele_text.append(text)
+
+    def end(self, tag):
+        self.depth -= 1
+        if self.in_ele and tag == self.ele_tag:
+            self.in_ele = False
+        elif self.in_trkpt and tag == self.trkpt_tag:
+            self.in_trkpt = False
+            if self.lat is None or self.lon is None:
+                missing = "lat" if self.lat is None else "lon"
+                print(f"Warning: Skipping trackpoint missing required attribute: '{missing}'", file=sys.stderr)
+                return
+            self.lat_texts.append(self.lat)
+            self.lon_texts.append(self.lon)
+            self.ele_texts.append("".join(self.ele_text) if self.ele_text else "0.0") # Default altitude
+            if len(self.lat_texts) >= self.batch:
+                self.flush()
+
+    def flush(self):
+        self.parsed += append_points(self.lats, self.lons, self.alts,
+                                     self.lat_texts, self.lon_texts, self.ele_texts,
+                                     self.bbox, self.index, self.parsed)
+        self.lat_texts.clear()
+        self.lon_texts.clear()
+        self.ele_texts.clear()
+
+    def close(self):
+        self.flush()
+        return Track.from_arrays(self.lats, self.lons, self.alts, self.parsed, self.index)
+
+def parse_gpx(gpx_path, bbox=None):
+    """
+    Parses a GPX file and returns a Track of (latitude, longitude, altitude)
+    points. Handles potential parsing errors.
+
+    If 'bbox' is given as corners (lat1, lon1, lat2, lon2), the bounding-box
+    filter is applied while parsing; Track.parsed still counts every valid
+    trackpoint read.
+
+    Uses lxml with a TrkptTarget when lxml is installed, otherwise the
+    ElementTree streaming parser.
+    """
+    try:
+        with open(gpx_path, "rb") as f:
+            if LET is not None:
+                parser = LET.XMLParser(target=TrkptTarget(bbox=bbox), huge_tree=True)
+                return LET.parse(f, parser)
+            return parse_gpx_stream(f, bbox=bbox)
+    except PARSE_ERRORS as e:
+        print(f"Error parsing GPX file {gpx_path}: {e}", file=sys.stderr)
+        return None # Indicate failure
+    except FileNotFoundError:
+        print(f"Error: GPX file not found at {gpx_path}", file=sys.stderr)
+        return None # Indicate failure
+
+def filter_coords_by_bbox(track, lat1, lon1, lat2, lon2):
     """
     Filters out any (lat, lon, alt) that lies outside the bounding box
     defined by two opposite corners: (lat1, lon1) and (lat2, lon2).
 
-    Returns a new list of coords within the bounding box.
+    Returns a Track of the points within the bounding box. If the box
+    contains the track's whole extent, the input track is returned as-is;
+    otherwise the comparisons are done as vectorized NumPy masks.
     """
-    # Ensure coords is not None before proceeding
-    if coords is None:
-        return []
+    # Ensure track is not None before proceeding
+    if track is None:
+        return Track.from_arrays([], [], [])
 
     min_lat = min(lat1, lat2)
     max_lat = max(lat1, lat2)
     min_lon = min(lon1, lon2)
     max_lon = max(lon1, lon2)
 
-    filtered = []
-    for (lat, lon, alt) in coords:
-        if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
-            filtered.append((lat, lon, alt))
-    return filtered
+    # Whole track inside the box: nothing to filter
+    if (track.min_lat >= min_lat and track.max_lat <= max_lat and
+            track.min_lon >= min_lon and track.max_lon <= max_lon):
+        return track
+
+    lat = track.lats
+    lon = track.lons
+    mask = (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+    return track.take(mask)
 
-def create_plan_json(coords, step=1, default_alt=0.0, acceptance_radius=2.0):
+# Metres per degree of latitude (and of longitude at the equator)
+METERS_PER_DEG = 111320.0
+
+class CoordIndex:
     """
-    Builds a QGroundControl .plan JSON structure using every 'step'-th coordinate.
-    Altitude is set to 'default_alt' for a rover scenario.
-    Acceptance radius defines how close the vehicle must get to the waypoint.
+    Latitude-sorted index over a Track for answering many bounding-box
+    queries against the same track. Building it is O(N log N); each query
+    is a binary search on latitude plus a longitude mask over only the
+    points in that latitude band.
+    """
+
+    def __init__(self, track):
+        self.track = track
+        # Positions of the points in ascending latitude order
+        self.order = np.argsort(track.lats, kind="stable")
+        self.lat_sorted = track.lats[self.order]
+
+    def query(self, lat1, lon1, lat2, lon2):
+        """
+        Same result as filter_coords_by_bbox(self.track, ...): a Track of
+        the points inside the box, in their original track order.
+        """
+        track = self.track
+        min_lat = min(lat1, lat2)
+        max_lat = max(lat1, lat2)
+        min_lon = min(lon1, lon2)
+        max_lon = max(lon1, lon2)
+
+        # Whole track inside the box: nothing to filter
+        if (track.min_lat >= min_lat and track.max_lat <= max_lat and
+                track.min_lon >= min_lon and track.max_lon <= max_lon):
+            return track
 
-    Returns a Python dict ready to be saved as JSON, or None if coords is empty.
+        lo = np.searchsorted(self.lat_sorted, min_lat, side="left")
+        hi = np.searchsorted(self.lat_sorted, max_lat, side="right")
+        band = self.order[lo:hi]
+        lon = track.lons[band]
+        # Sort the survivors back into path order for waypoint generation
+        idx = np.sort(band[(lon >= min_lon) & (lon <= max_lon)])
+        return track.take(idx)
+
+@njit(cache=True)
+def dist2(lat1, lon1, lat2, lon2):
     """
-    if not coords:
-        return None # Cannot create a plan with no coordinates
+    Squared distance between two points in degrees of latitude, using an
+    equirectangular approximation around the first point.
+    """
+    dy = lat2 - lat1
+    dx = (lon2 - lon1) * math.cos(math.radians(lat1))
+    return dx * dx + dy * dy
 
-    items = []
-    do_jump_id = 1
-
-    # Determine planned home position from the first point in the filtered list
-    first_lat, first_lon, _ = coords[0]
-    # Use default_alt for home altitude matching the mission altitude frame/mode
-    planned_home = [first_lat, first_lon, default_alt]
-
-    for i in range(0, len(coords), step):
-        lat, lon, gpx_alt = coords[i]
-        # For a rover, we generally ignore actual altitude and just use a default.
-        alt = default_alt
-
-        item = {
-            "AMSLAltAboveTerrain": None,
-            "Altitude": alt,
-            "AltitudeMode": 1,       # 0=Absolute, 1=Relative to Home
-            "autoContinue": True,
-            "command": 16,          # MAV_CMD_NAV_WAYPOINT
-            "doJumpId": do_jump_id,
-            "frame": 3,             # MAV_FRAME_GLOBAL_RELATIVE_ALT
-            "params": [
-                0.0,                   # param1: Hold time in seconds
-                acceptance_radius,     # param2: Acceptance radius in meters (common default: 0 = default, here we set explicitly)
-                0.0,                   # param3: Pass-through radius (0 to pass through WP, >0 to orbit)
-                None,                  # param4: Desired Yaw angle at waypoint (None/NaN for unchanged) -> JSON null
-                lat,                   # param5: Latitude
-                lon,                   # param6: Longitude
-                alt                    # param7: Altitude
-            ],
-            "type": "SimpleItem"
-        }
-        items.append(item)
-        do_jump_id += 1
+@njit(cache=True)
+def thin(lats, lons, min_d2):
+    """
+    Sequential minimum-spacing kernel: walks the points once and keeps a
+    point when its squared distance (see dist2) to the previously kept
+    point is greater than 'min_d2'. The first point is always kept.
+    Returns the kept indices as int64.
+    """
+    n = len(lats)
+    keep = np.empty(n, dtype=np.int64)
+    if n == 0:
+        return keep
+    keep[0] = 0
+    count = 1
+    prev = 0
+    for i in range(1, n):
+        if dist2(lats[prev], lons[prev], lats[i], lons[i]) <= min_d2:
+            continue
+        keep[count] = i
+        count += 1
+        prev = i
+    return keep[:count]
+
+@njit(cache=True)
+def reject_spikes(lats, lons, run_start, max_d2, max_spike_len):
+    """
+    Sequential GPS spike kernel. A point further than the jump threshold
+    (squared: 'max_d2') from the last kept point, the anchor, is dropped
+    only if the track comes back: one of the next 'max_spike_len' points
+    of the same run lies within the threshold of the anchor. Otherwise the
+    jump is real movement and the point becomes the new anchor, so neither
+    a bad anchor nor sparse sampling can lock the filter out.
+
+    A run starts wherever run_start is True (and at index 0); the first
+    point of a run has no anchor and is dropped only if it is far from the
+    next point while that point and the one after it agree.
+    Returns the kept indices as int64.
+    """
+    n = len(lats)
+    keep = np.empty(n, dtype=np.int64)
+    count = 0
+    anchor = -1
+    for i in range(n):
+        if run_start[i]:
+            anchor = -1
+        if anchor < 0:
+            if (i + 2 < n and not run_start[i + 1] and not run_start[i + 2] and
+                    dist2(lats[i], lons[i], lats[i + 1], lons[i + 1]) > max_d2 and
+                    dist2(lats[i + 1], lons[i + 1], lats[i + 2], lons[i + 2]) <= max_d2):
+                continue # Outlier at the start of a run
+        elif dist2(lats[anchor], lons[anchor], lats[i], lons[i]) > max_d2:
+            returns = False
+            for j in range(i + 1, min(i + 1 + max_spike_len, n)):
+                if run_start[j]:
+                    break
+                if dist2(lats[anchor], lons[anchor], lats[j], lons[j]) <= max_d2:
+                    returns = True
+                    break
+            if returns:
+                continue # Spike: the track comes back next to the anchor
+        keep[count] = i
+        count += 1
+        anchor = i
+    return keep[:count]
+
+def _kernel_columns(*columns):
+    if HAVE_NUMBA:
+        return columns
+    # Plain Python indexes lists much faster than ndarrays
+    return tuple(c.tolist() for c in columns)
+
+def _keep_track(track, keep):
+    if len(keep) == len(track):
+        return track
+    return track.take(keep)
 
-    # Ensure there's at least one item if coords was not empty
-    if not items:
-         print("Warning: No waypoints generated after applying step filter.", file=sys.stderr)
-         return None
+def filter_jumps(track, max_jump_m=100.0, max_spike_len=3):
+    """
+    Drops GPS spikes: runs of up to 'max_spike_len' points that jump more
+    than 'max_jump_m' metres from the previously kept point and then come
+    back. Larger jumps that do not come back are kept as real movement.
+    Points on either side of a gap in the track (e.g. where it left the
+    bounding box) are never compared with each other.
+    """
+    if len(track) < 2:
+        return track
+    lats, lons, run_start = _kernel_columns(track.lats, track.lons, track.run_starts())
+    keep = reject_spikes(lats, lons, run_start, (max_jump_m / METERS_PER_DEG) ** 2, max_spike_len)
+    return _keep_track(track, keep)
+
+def decimate_track(track, step=1, min_spacing_m=10.0):
+    """
+    Thins a Track before any waypoint dicts are built: keeps every
+    'step'-th point, then drops points within 'min_spacing_m' metres of
+    the previously kept point.
+    A min_spacing_m of 0 or less disables the spacing filter.
+    """
+    stepped = track.take(slice(None, None, step))
+    if min_spacing_m <= 0 or len(stepped) < 2:
+        return stepped
+    lats, lons = _kernel_columns(stepped.lats, stepped.lons)
+    return _keep_track(stepped, thin(lats, lons, (min_spacing_m / METERS_PER_DEG) ** 2))
+
+def build_item(lat, lon, alt, do_jump_id, acceptance_radius):
+    """
+    Returns one QGC SimpleItem waypoint (MAV_CMD_NAV_WAYPOINT) as a dict.
+    """
+    return {
+        "AMSLAltAboveTerrain": None,
+        "Altitude": alt,
+        "AltitudeMode": 1,       # 0=Absolute, 1=Relative to Home
+        "autoContinue": True,
+        "command": 16,          # MAV_CMD_NAV_WAYPOINT
+        "doJumpId": do_jump_id,
+        "frame": 3,             # MAV_FRAME_GLOBAL_RELATIVE_ALT
+        "params": [
+            0.0,                   # param1: Hold time in seconds
+            acceptance_radius,     # param2: Acceptance radius in meters (common default: 0 = default, here we set explicitly)
+            0.0,                   # param3: Pass-through radius (0 to pass through WP, >0 to orbit)
+            None,                  # param4: Desired Yaw angle at waypoint (None/NaN for unchanged) -> JSON null
+            lat,                   # param5: Latitude
+            lon,                   # param6: Longitude
+            alt                    # param7: Altitude
+        ],
+        "type": "SimpleItem"
+    }
 
+# Pre-serialized compact form of build_item, for the streaming writer.
+# Fields: Altitude, doJumpId, acceptance radius, latitude, longitude, altitude.
+# Floats go through %r, i.e. the shortest round-tripping repr that the json
+# module also uses, rather than fixed-precision %f rounding.
+WAYPOINT_TEMPLATE = (
+    '{"AMSLAltAboveTerrain":null,"Altitude":%r,"AltitudeMode":1,'
+    '"autoContinue":true,"command":16,"doJumpId":%d,"frame":3,'
+    '"params":[0.0,%r,0.0,null,%r,%r,%r],"type":"SimpleItem"}'
+)
 
-    plan = {
+def build_plan(items, planned_home):
+    """
+    Wraps mission items in the QGC .plan top-level structure.
+    """
+    return {
         "fileType": "Plan",
         "groundStation": "QGroundControl",
         "version": 1,
@@ -154,11 +596,139 @@ def create_plan_json(coords, step=1, default_alt=0.0, acceptance_radius=2.0):
         }
     }
 
-    return plan
+def planned_home_position(track, default_alt=0.0):
+    """
+    Returns the planned home position: the first point of the track, with
+    default_alt for altitude to match the mission altitude frame/mode.
+    """
+    return [float(track.lats[0]), float(track.lons[0]), default_alt]
+
+def create_plan_json(track, step=1, default_alt=0.0, acceptance_radius=2.0):
+    """
+    Builds a QGroundControl .plan JSON structure using every 'step'-th coordinate.
+    Altitude is set to 'default_alt' for a rover scenario.
+    Acceptance radius defines how close the vehicle must get to the waypoint.
+
+    Returns a Python dict ready to be saved as JSON, or None if track is empty.
+    For large tracks prefer write_plan, which streams items to a file.
+    """
+    if track is None or len(track) == 0:
+        return None # Cannot create a plan with no coordinates
+
+    # For a rover, we generally ignore actual altitude and just use a default.
+    items = [
+        build_item(lat, lon, default_alt, do_jump_id, acceptance_radius)
+        for do_jump_id, (lat, lon) in enumerate(
+            zip(track.lats[::step].tolist(), track.lons[::step].tolist()), start=1)
+    ]
+
+    return build_plan(items, planned_home_position(track, default_alt))
+
+def write_plan(f, track, step=1, default_alt=0.0, acceptance_radius=2.0):
+    """
+    Writes the same plan as create_plan_json to the text file 'f' as
+    compact JSON, streaming one waypoint at a time. Items are formatted
+    straight from WAYPOINT_TEMPLATE, so no dict is built per waypoint.
+
+    Returns the number of waypoints written (0 if track is empty, in which
+    case nothing is written).
+    """
+    if track is None or len(track) == 0:
+        return 0
+
+    # Serialize the fixed structure once and split it around the items list
+    skeleton = json.dumps(build_plan([], planned_home_position(track, default_alt)),
+                          separators=(",", ":"))
+    header, trailer = skeleton.split('"items":[]', 1)
+    f.write(header)
+    f.write('"items":[')
+
+    sep = ""
+    count = 0
+    # For a rover, we generally ignore actual altitude and just use a default.
+    # Plain floats so %r never sees a NumPy scalar repr
+    alt = float(default_alt)
+    radius = float(acceptance_radius)
+    for lat, lon in zip(track.lats[::step].tolist(), track.lons[::step].tolist()):
+        count += 1
+        f.write(sep)
+        f.write(WAYPOINT_TEMPLATE % (alt, count, radius, lat, lon, alt))
+        sep = ","
+
+    f.write("]")
+    f.write(trailer)
+    return count
+
+def process_one(job):
+    """
+    Runs the whole pipeline for one file in a batch job:
+    job is (gpx_file, output_plan, step, lat1, lon1, lat2, lon2).
+    Returns (gpx_file, number of waypoints written). The count is None if
+    the file failed to parse or could not be written, and 0 if no points
+    survived filtering (no output file is written then).
+    Any OSError (unreadable input, unwritable output) fails only this job.
+    """
+    gpx_file, output_plan, step, lat1, lon1, lat2, lon2 = job
+
+    try:
+        track_in_box = parse_gpx(gpx_file, bbox=(lat1, lon1, lat2, lon2))
+    except OSError as e:
+        print(f"Error reading GPX file {gpx_file}: {e}", file=sys.stderr)
+        return gpx_file, None
+    if track_in_box is None:
+        return gpx_file, None
+
+    track_clean = filter_jumps(track_in_box, max_jump_m=100.0)
+    waypoints = decimate_track(track_clean, step=step, min_spacing_m=10.0)
+    if len(waypoints) == 0:
+        return gpx_file, 0
+
+    try:
+        with open(output_plan, 'w') as f:
+            return gpx_file, write_plan(f, waypoints, default_alt=0.0, acceptance_radius=2.0)
+    except OSError as e:
+        print(f"Error writing output file {output_plan}: {e}", file=sys.stderr)
+        return gpx_file, None
+
+def run_batch(gpx_files, output_dir, step, lat1, lon1, lat2, lon2):
+    """
+    Processes many GPX files in parallel, one worker process per CPU core.
+    Each plan is written under output_dir at the GPX file's path relative
+    to the inputs' common directory, with a .plan extension, so files with
+    the same name in different directories do not overwrite each other.
+    Returns the number of files that failed.
+    """
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in gpx_files])
+    failed = 0
+    jobs = []
+    claimed = {}
+    for gpx_file in gpx_files:
+        rel = os.path.relpath(os.path.abspath(gpx_file), root)
+        output_plan = os.path.join(output_dir, os.path.splitext(rel)[0] + ".plan")
+        if output_plan in claimed:
+            # e.g. track.gpx and track.GPX side by side
+            print(f"{gpx_file}: failed, output {output_plan} already used by {claimed[output_plan]}")
+            failed += 1
+            continue
+        claimed[output_plan] = gpx_file
+        os.makedirs(os.path.dirname(output_plan), exist_ok=True)
+        jobs.append((gpx_file, output_plan, step, lat1, lon1, lat2, lon2))
+
+    with ProcessPoolExecutor() as ex:
+        for gpx_file, num_waypoints in ex.map(process_one, jobs):
+            if num_waypoints is None:
+                failed += 1
+                print(f"{gpx_file}: failed")
+            elif num_waypoints == 0:
+                print(f"{gpx_file}: no points within the bounding box, skipped")
+            else:
+                print(f"{gpx_file}: {num_waypoints} waypoints")
+    return failed
 
 def main():
     if len(sys.argv) < 8:
         print("Usage: python create_plan_from_gpx_bounding_corners.py <input.gpx> <step> <lat1> <lon1> <lat2> <lon2> <output.plan>")
+        print("       python create_plan_from_gpx_bounding_corners.py <gpx_dir | 'glob*.gpx'> <step> <lat1> <lon1> <lat2> <lon2> <output_dir>")
         print("Example: python create_plan_from_gpx_bounding_corners.py track.gpx 10 41.70 -85.03 41.71 -85.02 rover_mission.plan")
         sys.exit(1)
 
@@ -179,46 +749,63 @@ def main():
         print(f"Error: Invalid numeric argument: {e}", file=sys.stderr)
         sys.exit(1)
 
-    # 1) Parse GPX (includes basic file/parse error handling now)
-    coords = parse_gpx(gpx_file)
-    if coords is None: # Check if parsing failed
+    # Batch mode: a directory or glob pattern of GPX files. An existing file
+    # is always a single-file run, even if its name contains glob characters.
+    is_glob = not os.path.isfile(gpx_file) and any(ch in gpx_file for ch in "*?[")
+    if os.path.isdir(gpx_file) or is_glob:
+        pattern = os.path.join(gpx_file, "*.gpx") if os.path.isdir(gpx_file) else gpx_file
+        gpx_files = sorted(glob.glob(pattern))
+        if not gpx_files:
+            print(f"No GPX files found for {gpx_file}")
+            sys.exit(2)
+        failed = run_batch(gpx_files, output_plan, step, lat1, lon1, lat2, lon2)
+        print(f"\nProcessed {len(gpx_files)} GPX files into {output_plan} ({failed} failed).")
+        sys.exit(2 if failed else 0)
+
+    # 1) Parse GPX (includes basic file/parse error handling now), dropping
+    # points outside the bounding box as they are parsed
+    track_in_box = parse_gpx(gpx_file, bbox=(lat1, lon1, lat2, lon2))
+    if track_in_box is None: # Check if parsing failed
         sys.exit(2)
-    if not coords:
+    if track_in_box.parsed == 0:
         print(f"No valid GPX trackpoints found in {gpx_file}")
         sys.exit(2)
-    print(f"Successfully parsed {len(coords)} points from {gpx_file}.")
+    print(f"Successfully parsed {track_in_box.parsed} points from {gpx_file}.")
 
-    # 2) Filter out points outside the bounding box
-    coords_in_box = filter_coords_by_bbox(coords, lat1, lon1, lat2, lon2)
-    if not coords_in_box:
+    # 2) Report the points that fell inside the bounding box
+    if len(track_in_box) == 0:
         print("No points found within the specified bounding box.")
         # Decide if this is an error or just an outcome
         # Let's exit gracefully without creating an empty file
         sys.exit(0) # Exit code 0 indicating normal termination, just no points.
-    print(f"Filtered down to {len(coords_in_box)} points within the bounding box.")
+    print(f"Filtered down to {len(track_in_box)} points within the bounding box.")
 
 
-    # 3) Build the QGC .plan JSON with the filtered points (stepped).
-    # Can add acceptance_radius as parameter later if needed
-    plan_data = create_plan_json(coords_in_box, step=step, default_alt=0.0, acceptance_radius=2.0)
+    # 3) Reject GPS jumps before they become waypoints
+    track_clean = filter_jumps(track_in_box, max_jump_m=100.0)
+    if len(track_clean) < len(track_in_box):
+        print(f"Dropped {len(track_in_box) - len(track_clean)} points as GPS jumps (> 100 m).")
 
-    if plan_data is None:
+    # 4) Apply the step and minimum waypoint spacing before building items
+    waypoints = decimate_track(track_clean, step=step, min_spacing_m=10.0)
+
+    if len(waypoints) == 0:
          print("Failed to generate plan data (likely no points after stepping).")
          sys.exit(4)
 
-    # 4) Save to .plan
+    # 5) Stream the QGC .plan JSON with the decimated points to the file.
+    # Can add acceptance_radius as parameter later if needed
     try:
         with open(output_plan, 'w') as f:
-            json.dump(plan_data, f, indent=4)
+            num_waypoints = write_plan(f, waypoints, default_alt=0.0, acceptance_radius=2.0)
     except IOError as e:
         print(f"Error writing output file {output_plan}: {e}", file=sys.stderr)
         sys.exit(5)
 
-    num_waypoints = len(plan_data['mission']['items'])
     print(f"\nSuccessfully created QGC .plan file: {output_plan}")
-    print(f"Included {num_waypoints} waypoints (every {step}-th point within the box).")
+    print(f"Included {num_waypoints} waypoints (every {step}-th point within the box, at least 10 m apart).")
     print(f"Bounding Box Corners: ({lat1}, {lon1}), ({lat2}, {lon2})")
-    print(f"Planned Home Position set near first waypoint: {plan_data['mission']['plannedHomePosition']}")
+    print(f"Planned Home Position set near first waypoint: {planned_home_position(waypoints, 0.0)}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,149 @@
+import io
+import json
+import math
+
+import gps_parser
+
+
+def gpx_bytes(points):
+    """Builds a namespaced GPX document from (lat, lon, ele) string triples."""
+    body = "".join(
+        f'<trkpt lat="{lat}" lon="{lon}"><ele>{ele}</ele></trkpt>'
+        for lat, lon, ele in points
+    )
+    return (
+        '<?xml version="1.0"?><gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">'
+        f"<trk><trkseg>{body}</trkseg></trk></gpx>"
+    ).encode("utf-8")
+
+
+def test_non_finite_values_handled_the_same_in_every_batch():
+    # Well-formed batch apart from the nan: must not slip through the fast path
+    track = gps_parser.parse_gpx_stream(io.BytesIO(gpx_bytes([
+        ("nan", "-85.0", "1"),
+        ("41.7", "-85.0", "inf"),
+        ("41.7", "-85.0", "2"),
+    ])))
+    assert track.lats.tolist() == [41.7, 41.7]
+    assert track.alts.tolist() == [0.0, 2.0]
+
+    # Same nan alongside an unparseable value takes the fallback path
+    track = gps_parser.parse_gpx_stream(io.BytesIO(gpx_bytes([
+        ("nan", "-85.0", "1"),
+        ("x", "-85.0", "1"),
+        ("41.7", "-85.0", "2"),
+    ])))
+    assert track.lats.tolist() == [41.7]
+
+    out = io.StringIO()
+    gps_parser.write_plan(out, track)
+    json.loads(out.getvalue()) # Valid JSON, no bare nan
+    assert all(math.isfinite(v) for v in track.lons.tolist())
+
+
+def line_track(n, spacing_m, lat0=41.7, lon0=-85.0):
+    """Track heading due north with 'spacing_m' metres between points."""
+    step = spacing_m / gps_parser.METERS_PER_DEG
+    return gps_parser.Track.from_arrays(
+        [lat0 + i * step for i in range(n)], [lon0] * n, [0.0] * n)
+
+
+def test_filter_jumps_drops_isolated_spike():
+    track = line_track(20, 5.0)
+    track.lats[10] += 1.0 # ~111 km spike
+    kept = gps_parser.filter_jumps(track, max_jump_m=100.0)
+    assert len(kept) == 19
+    assert kept.lats.max() < 41.71
+
+
+def test_filter_jumps_keeps_sparse_sampling():
+    # Every step is a 150 m "jump", but the track never comes back
+    track = line_track(50, 150.0)
+    assert len(gps_parser.filter_jumps(track, max_jump_m=100.0)) == 50
+
+
+def test_filter_jumps_drops_outlier_first_point():
+    track = line_track(51, 5.0)
+    track.lats[0] -= 1.0
+    kept = gps_parser.filter_jumps(track, max_jump_m=100.0)
+    assert len(kept) == 50
+    assert kept.lats[0] == track.lats[1]
+
+
+def test_decimate_track_enforces_min_spacing():
+    kept = gps_parser.decimate_track(line_track(100, 3.0), min_spacing_m=10.0)
+    gaps = [b - a for a, b in zip(kept.lats.tolist(), kept.lats.tolist()[1:])]
+    assert min(gaps) * gps_parser.METERS_PER_DEG > 10.0
+
+
+def test_filter_jumps_resets_at_bbox_gaps():
+    m = 1.0 / gps_parser.METERS_PER_DEG
+    lat0, lon0 = 41.7, -85.0
+    points = []
+    # 100 points north inside the box
+    points += [(lat0 + i * 5 * m, lon0) for i in range(100)]
+    top = lat0 + 99 * 5 * m
+    # 100 points well east of the box
+    points += [(top, lon0 + 0.01 + i * 5 * m) for i in range(100)]
+    # Re-enter 150 m east of the exit point, head back west, then north
+    points += [(top, lon0 + (150 - 30 * i) * m) for i in range(6)]
+    points += [(top + i * 5 * m, lon0) for i in range(1, 195)]
+
+    bbox = (lat0 - 0.001, lon0 - 0.001, lat0 + 0.02, lon0 + 0.005)
+    data = gpx_bytes([(repr(lat), repr(lon), "0") for lat, lon in points])
+    track = gps_parser.parse_gpx_stream(io.BytesIO(data), bbox=bbox)
+    assert track.parsed == 400
+    assert len(track) == 300
+    assert track.run_starts().sum() == 2
+
+    assert len(gps_parser.filter_jumps(track, max_jump_m=100.0)) == 300
+
+
+def write_gpx(path, n=50, lat0=41.7, lon0=-85.0):
+    m = 1.0 / gps_parser.METERS_PER_DEG
+    path.write_bytes(gpx_bytes([(repr(lat0 + i * 20 * m), repr(lon0), "0") for i in range(n)]))
+
+
+def run_main(monkeypatch, gpx_arg, out_arg):
+    monkeypatch.setattr("sys.argv", ["gps_parser.py", gpx_arg, "1",
+                                     "41.69", "-85.01", "41.72", "-84.99", out_arg])
+    try:
+        gps_parser.main()
+    except SystemExit as e:
+        return e.code
+    return 0
+
+
+def test_main_treats_existing_file_with_glob_characters_as_single_file(tmp_path, monkeypatch):
+    gpx = tmp_path / "trk[1].gpx"
+    write_gpx(gpx)
+    out = tmp_path / "out.plan"
+    assert run_main(monkeypatch, str(gpx), str(out)) == 0
+    assert len(json.loads(out.read_text())["mission"]["items"]) == 50
+
+
+def test_batch_keeps_same_named_files_apart(tmp_path, monkeypatch):
+    for sub in ("x", "y"):
+        (tmp_path / "in" / sub).mkdir(parents=True)
+        write_gpx(tmp_path / "in" / sub / "t.gpx")
+    (tmp_path / "in" / "y" / "t.GPX").write_bytes((tmp_path / "in" / "y" / "t.gpx").read_bytes())
+    out = tmp_path / "out"
+
+    code = run_main(monkeypatch, str(tmp_path / "in" / "*" / "t.*"), str(out))
+    assert code == 2 # t.GPX clashes with t.gpx in the same directory
+    assert (out / "x" / "t.plan").is_file()
+    assert (out / "y" / "t.plan").is_file()
+
+
+def test_batch_reports_unreadable_input_as_failed(tmp_path, monkeypatch, capsys):
+    write_gpx(tmp_path / "a.gpx")
+    (tmp_path / "sub.gpx").mkdir() # Matches the glob but cannot be opened
+    write_gpx(tmp_path / "z.gpx")
+    out = tmp_path / "out"
+
+    assert run_main(monkeypatch, str(tmp_path / "*.gpx"), str(out)) == 2
+    stdout = capsys.readouterr().out
+    assert "sub.gpx: failed" in stdout
+    assert "(1 failed)" in stdout
+    assert (out / "a.plan").is_file()
+    assert (out / "z.plan").is_file()